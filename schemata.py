@@ -3,13 +3,20 @@
 Fractal Web Honeypot - Traps web crawlers in an infinite fractal structure
 """
 
-from flask import Flask, request, render_template_string, abort, make_response
+from flask import Flask, Response, request, abort
+from jinja2 import Environment
 import hashlib
 import time
 import random
 import json
 import os
-from datetime import datetime
+import queue
+import re
+import threading
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
 from urllib.parse import quote
 
 app = Flask(__name__)
@@ -21,6 +28,8 @@ CONFIG = {
     'max_depth': 100,  # Maximum depth to generate unique paths
     'delay_min': 0.1,  # Minimum delay in seconds
     'delay_max': 2.0,  # Maximum delay in seconds
+    'drip_chunks': 4,  # Pieces a delayed page body is dripped out in
+    'cache_path_max': 256,  # Longer exploration paths are rendered without caching
     'log_file': 'honeypot.log',
     'blocked_user_agents': [
         'scrapy',
@@ -36,17 +45,50 @@ CONFIG = {
     'fake_content': True,  # Generate fake content to look realistic
 }
 
-# In-memory store for tracking crawlers
+# Link card labels; N is fixed at import so the slices are taken once here
+ROMAN_NUMERALS = ('I', 'II', 'III', 'IV', 'V', 'VI', 'VII', 'VIII', 'IX', 'X')[:CONFIG['N']]
+COMPLEXITY_LEVELS = ('Low', 'Medium', 'High', 'Very High', 'Extreme', 'Chaotic', 'Infinite')[:CONFIG['N']]
+DESCRIPTORS = ('quasi-self-similar', 'self-similar', 'scale-invariant', 'recursive',
+               'chaotic', 'complex', 'detailed', 'intricate', 'beautiful')
+
+# One alternation over all blocked agents, so a check is a single scan of the UA
+BLOCKED_UA_RE = re.compile('|'.join(map(re.escape, CONFIG['blocked_user_agents'])))
+
+@dataclass(slots=True)
+class CrawlerInfo:
+    """Per-crawler counters; only the most recent paths are kept so memory stays bounded"""
+    first_seen: str
+    last_seen: str
+    max_depth: int
+    visit_count: int = 1
+    last_paths: deque = field(default_factory=lambda: deque(maxlen=32))
+
+# Generated exploration paths start with their depth as three hex digits.
+# The width is fixed so hash segments (16 hex digits) never read as a depth,
+# which caps generated depths at 0xfff.
+DEPTH_PREFIX_RE = re.compile(r'([0-9a-f]{3})/')
+if CONFIG['max_depth'] > 0xfff:
+    raise ValueError("CONFIG['max_depth'] must be at most 0xfff (4095) to fit the depth prefix")
+
+# In-memory store for tracking crawlers, keyed by (ip, user_agent)
 crawler_tracker = {}
 
+# Log lines queued by request handlers, written out by a background thread.
+# Bounded, so lines are dropped rather than piling up if the writer falls
+# behind or dies.
+log_queue = queue.Queue(maxsize=10000)
+log_thread = None
+log_lock = threading.Lock()
+
 # HTML templates
-MAIN_TEMPLATE = """
+# The page is split so that only the variable middle goes through Jinja;
+# the head (styles, script) and footer are sent as pre-encoded bytes.
+HEAD_HTML = """
 <!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{% if depth > 0 %}Fractal Research - Level {{ depth }}{% else %}Fractal Mathematics Research Center{% endif %}</title>
     <style>
         body {
             font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
@@ -144,6 +186,10 @@ MAIN_TEMPLATE = """
             }, 300);
         });
     </script>
+"""
+
+BODY_TEMPLATE = """
+    <title>{% if depth > 0 %}Fractal Research - Level {{ depth }}{% else %}Fractal Mathematics Research Center{% endif %}</title>
 </head>
 <body>
     <div class="container">
@@ -159,7 +205,7 @@ MAIN_TEMPLATE = """
         </div>
         
         {% if fake_content %}
-        <p>This region of the Mandelbrot set exhibits {{ descriptors|random }} behavior. 
+        <p>This region of the Mandelbrot set exhibits {{ descriptor }} behavior. 
         The fractal dimension at this zoom level is approximately {{ (1.5 + depth * 0.1)|round(2) }}.</p>
         
         <div class="stats">
@@ -198,239 +244,391 @@ MAIN_TEMPLATE = """
                 <em>Computing next fractal iteration... This may take a moment.</em>
             </div>
             {% endif %}
+"""
+
+FOOTER_HTML = """
         </div>
     </div>
 </body>
 </html>
 """
 
+STATS_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head><title>Honeypot Statistics</title>
+<style>
+    body { font-family: monospace; margin: 20px; }
+    table { border-collapse: collapse; width: 100%; }
+    th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+    th { background-color: #4CAF50; color: white; }
+    tr:nth-child(even) { background-color: #f2f2f2; }
+</style>
+</head>
+<body>
+    <h1>Fractal Honeypot Statistics</h1>
+    <p>Total unique crawlers: {{ crawlers|length }}</p>
+    <table>
+        <tr>
+            <th>IP</th>
+            <th>User Agent</th>
+            <th>First Seen</th>
+            <th>Last Seen</th>
+            <th>Max Depth</th>
+            <th>Visit Count</th>
+        </tr>
+        {% for (ip, ua), data in crawlers %}
+        <tr>
+            <td>{{ ip }}</td>
+            <td>{{ ua[:50] }}</td>
+            <td>{{ data.first_seen }}</td>
+            <td>{{ data.last_seen }}</td>
+            <td>{{ data.max_depth }}</td>
+            <td>{{ data.visit_count }}</td>
+        </tr>
+        {% endfor %}
+    </table>
+    <br>
+    <a href="/">Back to honeypot</a>
+</body>
+</html>
+"""
+
+# Templates are parsed once at import; autoescape matches render_template_string
+jinja_env = Environment(autoescape=True, auto_reload=False)
+BODY_TMPL = jinja_env.from_string(BODY_TEMPLATE)
+STATS_TMPL = jinja_env.from_string(STATS_TEMPLATE)
+
+HEAD_BYTES = HEAD_HTML.encode()
+FOOT_BYTES = FOOTER_HTML.encode()
+
+# Gzip responses are one member (clients stop decoding after the first), so the
+# head is compressed once into a gzip header plus a sync-flushed deflate block,
+# and each page carries on from a copy of that compressor
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x02\xff'  # deflate, mtime=0, max compression
+HEAD_DEFLATE = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+HEAD_GZ = GZIP_HEADER + HEAD_DEFLATE.compress(HEAD_BYTES) + HEAD_DEFLATE.flush(zlib.Z_SYNC_FLUSH)
+HEAD_CRC = zlib.crc32(HEAD_BYTES)
+
 # Helper functions
 def generate_path_hash(path, salt=None):
     """Generate a unique hash for a path"""
     if salt is None:
-        salt = str(time.time())
-    return hashlib.sha256(f"{path}:{salt}".encode()).hexdigest()[:16]
+        salt = time.time()
+    # 8-byte BLAKE2b gives the same 16 hex chars as the old truncated SHA-256, cheaper
+    return hashlib.blake2b(f"{path}:{salt}".encode(), digest_size=8).hexdigest()
 
+@lru_cache(maxsize=1024)
 def should_block_request(user_agent):
     """Check if request should be blocked based on user agent"""
     if not user_agent:
         return False
-    user_agent = user_agent.lower()
-    for blocked in CONFIG['blocked_user_agents']:
-        if blocked in user_agent:
-            return True
-    return False
+    return BLOCKED_UA_RE.search(user_agent.lower()) is not None
+
+def log_writer(f):
+    """Drain the log queue into the log file, flushing whenever it runs dry"""
+    with f:
+        while True:
+            log_entry = log_queue.get()
+            f.write(log_entry)
+            
+            # Print to console
+            print(log_entry.decode().strip())
+            
+            if log_queue.empty():
+                f.flush()
+
+def start_log_writer():
+    """Open the log file and start the writer on the first logged hit.
+
+    Not done at import: under gunicorn --preload that would run the thread
+    in the master only. The file is opened here, in the request, so a log
+    that cannot be opened raises instead of the thread dying quietly.
+    """
+    global log_thread
+    with log_lock:
+        if log_thread is None:
+            f = open(CONFIG['log_file'], 'ab', buffering=1 << 16)
+            if f.tell() == 0:
+                f.write(b"Fractal Honeypot Access Log\n" + b"=" * 50 + b"\n")
+            log_thread = threading.Thread(target=log_writer, args=(f,), name='log-writer', daemon=True)
+            log_thread.start()
+
+def reset_log_writer():
+    """After a fork: the parent's writer thread does not exist in the child"""
+    global log_queue, log_thread, log_lock
+    log_queue = queue.Queue(maxsize=10000)
+    log_thread = None
+    log_lock = threading.Lock()
 
-def log_request(path, ip, user_agent, depth):
+os.register_at_fork(after_in_child=reset_log_writer)
+
+def log_request(path, ip, user_agent, depth, now):
     """Log request to file and console"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"{timestamp} | IP: {ip} | Depth: {depth} | Path: {path} | UA: {user_agent[:100]}\n"
-    
-    # Write to log file
-    with open(CONFIG['log_file'], 'a') as f:
-        f.write(log_entry)
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+    log_entry = b"%s | IP: %s | Depth: %d | Path: %s | UA: %s\n" % (
+        timestamp.encode(), str(ip).encode(), depth, path.encode(), user_agent[:100].encode()
+    )
     
-    # Print to console
-    print(log_entry.strip())
+    # Hand off to the writer thread; no file I/O on the request path
+    if log_thread is None:
+        start_log_writer()
+    try:
+        log_queue.put_nowait(log_entry)
+    except queue.Full:
+        pass
     
     # Track crawler
-    crawler_key = f"{ip}:{user_agent}"
-    if crawler_key not in crawler_tracker:
-        crawler_tracker[crawler_key] = {
-            'first_seen': timestamp,
-            'last_seen': timestamp,
-            'max_depth': depth,
-            'visit_count': 1,
-            'paths': [path]
-        }
+    crawler_key = (ip, user_agent)
+    info = crawler_tracker.get(crawler_key)
+    if info is None:
+        info = crawler_tracker[crawler_key] = CrawlerInfo(timestamp, timestamp, depth)
     else:
-        crawler_tracker[crawler_key]['last_seen'] = timestamp
-        crawler_tracker[crawler_key]['max_depth'] = max(
-            crawler_tracker[crawler_key]['max_depth'], depth
-        )
-        crawler_tracker[crawler_key]['visit_count'] += 1
-        crawler_tracker[crawler_key]['paths'].append(path)
-
-def generate_fractal_links(path, depth):
+        info.last_seen = timestamp
+        info.visit_count += 1
+        if depth > info.max_depth:
+            info.max_depth = depth
+    info.last_paths.append(path)
+
+def path_depth(fractal_path):
+    """Depth of an exploration path, read from its prefix instead of scanning the whole path"""
+    match = DEPTH_PREFIX_RE.match(fractal_path)
+    if match:
+        return int(match.group(1), 16)
+    # Paths we did not generate ourselves, including the cycle/ entry points
+    return fractal_path.count('/') + 1 if fractal_path else 1
+
+def path_rng(fractal_path):
+    """RNG private to the request and seeded from the path, so its draws are
+    deterministic per path and never touch the shared module-level generator"""
+    return random.Random(zlib.crc32(fractal_path.encode()))
+
+def generate_fractal_links(path, depth, rng=random):
     """Generate N links for the current page"""
     links = []
-    roman_numerals = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII', 'VIII', 'IX', 'X'][:CONFIG['N']]
-    complexity_levels = ['Low', 'Medium', 'High', 'Very High', 'Extreme', 'Chaotic', 'Infinite'][:CONFIG['N']]
-    descriptors = ['quasi-self-similar', 'self-similar', 'scale-invariant', 'recursive', 
-                   'chaotic', 'complex', 'detailed', 'intricate', 'beautiful']
-    coordinates = []
+    N = CONFIG['N']
     
-    for i in range(1, CONFIG['N'] + 1):
+    # Child paths carry their own depth up front, followed by this path's segments
+    prefix = f"{depth + 1:03x}/"
+    match = DEPTH_PREFIX_RE.match(path)
+    tail = path[match.end():] if match else path
+    if tail:
+        prefix += tail + '/'
+    
+    # Same digests as generate_path_hash(path, i), but the (possibly long) path
+    # is encoded and absorbed once, and each link only hashes its index
+    base_hash = hashlib.blake2b(f"{path or 'root'}:".encode(), digest_size=8)
+    
+    for i in range(1, N + 1):
         # Create new path by appending segment
         if depth < CONFIG['max_depth']:
-            new_path = f"{path}/{generate_path_hash(path, i)}" if path else generate_path_hash('root', i)
+            link_hash = base_hash.copy()
+            link_hash.update(b"%d" % i)
+            new_path = prefix + link_hash.hexdigest()
         else:
             # After max depth, start recycling paths to create cycles
-            cycle_index = (depth * CONFIG['N'] + i) % (CONFIG['max_depth'] * CONFIG['N'])
+            cycle_index = (depth * N + i) % (CONFIG['max_depth'] * N)
             new_path = f"cycle/{cycle_index}"
         
         links.append(f"/explore/{new_path}")
-        
-        # Generate fake coordinates
-        coord_x = round(-0.743643 + (random.random() - 0.5) * (0.1 / (depth + 1)), 10)
-        coord_y = round(0.131825 + (random.random() - 0.5) * (0.1 / (depth + 1)), 10)
-        coordinates.append(f"{coord_x:.6f}, {coord_y:.6f}")
     
-    return links, roman_numerals, complexity_levels, descriptors, coordinates
+    # Generate fake coordinates around the same point, tighter at each level;
+    # the format spec does the rounding
+    spread = 0.1 / (depth + 1)
+    rand = rng.random
+    coordinates = [
+        f"{-0.743643 + (rand() - 0.5) * spread:.6f}, {0.131825 + (rand() - 0.5) * spread:.6f}"
+        for _ in range(N)
+    ]
+    
+    return links, coordinates
 
-def add_delay(depth):
-    """Add realistic delay based on depth"""
+def build_middle(fractal_path, depth):
+    """Render the variable middle of the page for a path.
+
+    The RNG is seeded from the path so output depends only on the arguments,
+    which lets repeat crawler hits (notably the cycle/ paths) come from the cache.
+    """
+    rng = path_rng(fractal_path)
+    links, coordinates = generate_fractal_links(fractal_path, depth, rng)
+    return BODY_TMPL.render(
+        N=CONFIG['N'],
+        depth=depth,
+        path=fractal_path or 'root',
+        links=links,
+        roman_numerals=ROMAN_NUMERALS,
+        complexity_levels=COMPLEXITY_LEVELS,
+        descriptor=rng.choice(DESCRIPTORS),
+        coordinates=coordinates,
+        fake_content=CONFIG['fake_content']
+    ).encode()
+
+def gzip_rest(middle):
+    """Rest of the gzip stream after HEAD_GZ: middle and footer deflated on a
+    copy of the primed head compressor, then the gzip trailer"""
+    rest = middle + FOOT_BYTES
+    deflate = HEAD_DEFLATE.copy()
+    crc = zlib.crc32(rest, HEAD_CRC)
+    size = (len(HEAD_BYTES) + len(rest)) & 0xffffffff
+    return (deflate.compress(rest) + deflate.flush()
+            + crc.to_bytes(4, 'little') + size.to_bytes(4, 'little'))
+
+# Only short paths are cached: every body repeats the path tail about nine
+# times, and long (necessarily unique) paths are rarely requested twice. At the
+# length cap a path costs ~9 KB across both caches, ~18 MB per worker when full.
+@lru_cache(maxsize=2048)
+def cached_middle(fractal_path, depth):
+    return build_middle(fractal_path, depth)
+
+@lru_cache(maxsize=2048)
+def cached_middle_gz(fractal_path, depth):
+    return gzip_rest(cached_middle(fractal_path, depth))
+
+def render_middle(fractal_path, depth):
+    """Page middle, from the cache when the path is short enough to be worth it"""
+    if len(fractal_path) <= CONFIG['cache_path_max']:
+        return cached_middle(fractal_path, depth)
+    return build_middle(fractal_path, depth)
+
+def render_middle_gz(fractal_path, depth):
+    """Gzipped counterpart of render_middle"""
+    if len(fractal_path) <= CONFIG['cache_path_max']:
+        return cached_middle_gz(fractal_path, depth)
+    return gzip_rest(build_middle(fractal_path, depth))
+
+def page_delay(depth, rng=random):
+    """Pick a realistic delay in seconds based on depth"""
     if depth > 3:
-        delay = random.uniform(CONFIG['delay_min'], CONFIG['delay_max'])
-        time.sleep(delay)
+        return rng.uniform(CONFIG['delay_min'], CONFIG['delay_max'])
+    return 0
+
+def delayed_body(parts, delay):
+    """Send the static head right away, then drip the rest of the page out
+    in CONFIG['drip_chunks'] pieces spread over `delay` seconds"""
+    head, middle, foot = parts
+    yield head
+    rest = middle + foot
+    chunks = CONFIG['drip_chunks']
+    step = -(-len(rest) // chunks)
+    pause = delay / chunks
+    for start in range(0, len(rest), step):
+        time.sleep(pause)
+        yield rest[start:start + step]
+
+def page_response(fractal_path, depth, delay=0):
+    """Assemble the page response, gzipped when the client accepts it.
+
+    With a delay the body is streamed, so the wait happens after headers and
+    the page head have gone out and the crawler is already committed to it.
+    Under gevent workers the pauses yield to other connections instead of
+    holding a thread.
+    """
+    use_gzip = request.accept_encodings['gzip'] > 0
+    if use_gzip:
+        parts = (HEAD_GZ, render_middle_gz(fractal_path, depth), b'')
+    else:
+        parts = (HEAD_BYTES, render_middle(fractal_path, depth), FOOT_BYTES)
+    
+    body = delayed_body(parts, delay) if delay else b''.join(parts)
+    response = Response(body, mimetype='text/html', direct_passthrough=True)
+    response.headers['Content-Length'] = str(sum(map(len, parts)))
+    response.headers['Vary'] = 'Accept-Encoding'
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
 
 @app.route('/')
 def index():
     """Main entry point"""
+    now = time.time()
     ip = request.remote_addr
     user_agent = request.headers.get('User-Agent', 'Unknown')
     
     if should_block_request(user_agent):
         abort(403)
     
-    log_request('/', ip, user_agent, 0)
-    
-    links, roman_numerals, complexity_levels, descriptors, coordinates = generate_fractal_links('', 0)
+    log_request('/', ip, user_agent, 0, now)
     
-    return render_template_string(
-        MAIN_TEMPLATE,
-        N=CONFIG['N'],
-        depth=0,
-        path='root',
-        links=links,
-        roman_numerals=roman_numerals,
-        complexity_levels=complexity_levels,
-        descriptors=descriptors,
-        coordinates=coordinates,
-        fake_content=CONFIG['fake_content']
-    )
+    return page_response('', 0)
 
 @app.route('/explore/')
 @app.route('/explore/<path:fractal_path>')
 def explore(fractal_path=''):
     """Fractal exploration pages - infinite recursion"""
+    now = time.time()
     ip = request.remote_addr
     user_agent = request.headers.get('User-Agent', 'Unknown')
     
     if should_block_request(user_agent):
         abort(403)
     
-    # Calculate depth from path
-    depth = fractal_path.count('/') + 1 if fractal_path else 1
+    depth = path_depth(fractal_path)
     
     # Log the request
-    log_request(fractal_path, ip, user_agent, depth)
+    log_request(fractal_path, ip, user_agent, depth, now)
     
     # Add realistic delay for deeper levels
-    add_delay(depth)
-    
-    # Generate links for next level
-    links, roman_numerals, complexity_levels, descriptors, coordinates = generate_fractal_links(
-        fractal_path, depth
-    )
-    
-    return render_template_string(
-        MAIN_TEMPLATE,
-        N=CONFIG['N'],
-        depth=depth,
-        path=fractal_path or 'root',
-        links=links,
-        roman_numerals=roman_numerals,
-        complexity_levels=complexity_levels,
-        descriptors=descriptors,
-        coordinates=coordinates,
-        fake_content=CONFIG['fake_content']
-    )
+    return page_response(fractal_path, depth, page_delay(depth, path_rng(fractal_path)))
 
-@app.route('/robots.txt')
-def robots():
-    """Misleading robots.txt to attract crawlers"""
-    response = make_response("""User-agent: *
+ROBOTS_TXT = b"""User-agent: *
 Disallow: /admin/
 Disallow: /private/
 Allow: /explore/
 Allow: /research/
 Sitemap: /sitemap.xml
-""")
-    response.headers['Content-Type'] = 'text/plain'
-    return response
+"""
 
-@app.route('/sitemap.xml')
-def sitemap():
-    """Dynamic sitemap that references infinite paths"""
+def build_sitemap():
+    """Build the sitemap XML that references infinite paths"""
     urls = ['/']
+    now = time.time()
+    # Equivalent to generate_path_hash(f"sitemap_{i}", now), copying a context
+    # that has already absorbed the shared prefix
+    base_hash = hashlib.blake2b(b"sitemap_", digest_size=8)
     for i in range(100):  # Generate many URLs to look legitimate
-        path = generate_path_hash(f"sitemap_{i}")
-        urls.append(f"/explore/{path}")
-    
-    sitemap_xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    sitemap_xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        path_hash = base_hash.copy()
+        path_hash.update(f"{i}:{now}".encode())
+        urls.append(f"/explore/{path_hash.hexdigest()}")
     
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n',
+    ]
     for url in urls:
-        sitemap_xml += f'  <url>\n    <loc>http://localhost:5000{url}</loc>\n    <priority>0.8</priority>\n  </url>\n'
+        parts.append(f'  <url>\n    <loc>http://localhost:5000{url}</loc>\n    <priority>0.8</priority>\n  </url>\n')
+    parts.append('</urlset>')
     
-    sitemap_xml += '</urlset>'
-    
-    response = make_response(sitemap_xml)
-    response.headers['Content-Type'] = 'application/xml'
-    return response
+    return ''.join(parts).encode()
+
+# Both documents are fixed for the life of the process, so build them and
+# their ETags once
+SITEMAP_XML = build_sitemap()
+ROBOTS_ETAG = hashlib.blake2b(ROBOTS_TXT, digest_size=8).hexdigest()
+SITEMAP_ETAG = hashlib.blake2b(SITEMAP_XML, digest_size=8).hexdigest()
+
+def cached_response(body, etag, mimetype):
+    """Serve a prebuilt body, answering 304 when the client already has it"""
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response.make_conditional(request)
+
+@app.route('/robots.txt')
+def robots():
+    """Misleading robots.txt to attract crawlers"""
+    return cached_response(ROBOTS_TXT, ROBOTS_ETAG, 'text/plain')
+
+@app.route('/sitemap.xml')
+def sitemap():
+    """Sitemap that references infinite paths"""
+    return cached_response(SITEMAP_XML, SITEMAP_ETAG, 'application/xml')
 
 @app.route('/stats')
 def stats():
     """Display statistics about trapped crawlers (for monitoring)"""
-    stats_html = """
-    <!DOCTYPE html>
-    <html>
-    <head><title>Honeypot Statistics</title>
-    <style>
-        body { font-family: monospace; margin: 20px; }
-        table { border-collapse: collapse; width: 100%; }
-        th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
-        th { background-color: #4CAF50; color: white; }
-        tr:nth-child(even) { background-color: #f2f2f2; }
-    </style>
-    </head>
-    <body>
-        <h1>Fractal Honeypot Statistics</h1>
-        <p>Total unique crawlers: {count}</p>
-        <table>
-            <tr>
-                <th>IP</th>
-                <th>User Agent</th>
-                <th>First Seen</th>
-                <th>Last Seen</th>
-                <th>Max Depth</th>
-                <th>Visit Count</th>
-            </tr>
-    """
-    
-    for key, data in crawler_tracker.items():
-        ip, ua = key.split(':', 1)
-        stats_html += f"""
-            <tr>
-                <td>{ip}</td>
-                <td>{ua[:50]}</td>
-                <td>{data['first_seen']}</td>
-                <td>{data['last_seen']}</td>
-                <td>{data['max_depth']}</td>
-                <td>{data['visit_count']}</td>
-            </tr>
-        """
-    
-    stats_html += """
-        </table>
-        <br>
-        <a href="/">Back to honeypot</a>
-    </body>
-    </html>
-    """
-    
-    return stats_html.format(count=len(crawler_tracker))
+    # Snapshot first: request threads keep adding crawlers while the template
+    # iterates, and a live dict would raise "changed size during iteration"
+    return STATS_TMPL.render(crawlers=list(crawler_tracker.items()))
 
 @app.errorhandler(403)
 def forbidden(e):
@@ -450,7 +648,8 @@ def forbidden(e):
 @app.errorhandler(404)
 def not_found(e):
     """Redirect 404 to a new fractal path"""
-    new_path = generate_path_hash('404_' + str(time.time()))
+    now = time.time()
+    new_path = generate_path_hash(f'404_{now}', now)
     return f'''
     <!DOCTYPE html>
     <html>
@@ -464,12 +663,6 @@ def not_found(e):
     '''
 
 if __name__ == '__main__':
-    # Create log file if it doesn't exist
-    if not os.path.exists(CONFIG['log_file']):
-        with open(CONFIG['log_file'], 'w') as f:
-            f.write("Fractal Honeypot Access Log\n")
-            f.write("=" * 50 + "\n")
-    
     print("=" * 60)
     print("Fractal Web Honeypot Starting...")
     print(f"• Access at: http://localhost:5000/")
@@ -13,9 +13,10 @@ def infinite_html(seed, depth=0):
     N = 5  # Links per page
     links = []
     
+    # One hash yields every next seed deterministically, 5 bytes (10 hex) each
+    digest = hashlib.blake2b(seed.encode(), digest_size=5 * N).hexdigest()
     for i in range(N):
-        # Generate next seed deterministically
-        next_seed = hashlib.md5(f"{seed}_{i}".encode()).hexdigest()[:10]
+        next_seed = digest[i * 10:(i + 1) * 10]
         links.append(f'<a href="/{next_seed}">Branch {next_seed}</a><br>')
     
     return f'''
@@ -13,17 +13,25 @@ Notes:
 
 from __future__ import annotations
 
+import atexit
 import base64
 import hashlib
 import hmac
 import json
 import os
+import queue
+import secrets
 import sqlite3
+import struct
+import threading
 import time
-from dataclasses import dataclass
-from typing import Optional, Dict, Tuple
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional, Dict, Iterator, List, Tuple, Union
 
-from flask import Flask, request, make_response, g
+from flask import Flask, Response, request, make_response, g
+
+from scoring import bot_score
 
 # ----------------------------
 # Configuration
@@ -41,16 +49,27 @@ MAX_PAGES_PER_CLIENT_PER_HOUR = int(os.environ.get("TSUKUYOMI_MAX_PAGES_PER_HOUR
 # Rate limiting (token bucket per client)
 RATE_LIMIT_RPS = float(os.environ.get("TSUKUYOMI_RL_RPS", "2.0"))        # average
 RATE_LIMIT_BURST = int(os.environ.get("TSUKUYOMI_RL_BURST", "10"))       # burst capacity
+LIMITER_PRUNE_INTERVAL = 5 * 60  # seconds between sweeps of idle limiter state
+
+# Telemetry writer batching
+WRITE_QUEUE_MAX = 10000      # rows buffered before new hits are dropped
+WRITE_BATCH_MAX = 200        # rows per transaction
+WRITE_BATCH_WINDOW = 0.1     # seconds to wait for a batch to fill
+OPTIMIZE_INTERVAL = 15 * 60  # seconds between PRAGMA optimize runs
+DROP_REPORT_INTERVAL = 10    # seconds between warnings about shed hits
 
 # Response behavior
 ADD_ARTIFICIAL_DELAY_FOR_HIGH_SCORE = True
 MAX_DELAY_SECONDS = 1.5
+DELAY_DRIP_CHUNKS = 4        # pieces a delayed body is dripped out in
 
 # If not set, generate an ephemeral secret (NOT recommended for production)
 if not SECRET_KEY:
     SECRET_KEY = base64.urlsafe_b64encode(os.urandom(32)).decode("ascii")
 
 SECRET_BYTES = SECRET_KEY.encode("utf-8")
+# BLAKE2b keys are capped at 64 bytes; longer secrets are condensed first
+MAC_KEY = SECRET_BYTES if len(SECRET_BYTES) <= 64 else hashlib.blake2b(SECRET_BYTES).digest()
 
 app = Flask(__name__)
 app.config["JSON_SORT_KEYS"] = False
@@ -65,41 +84,62 @@ app.config["JSON_SORT_KEYS"] = False
 class Bucket:
     tokens: float
     last: float
+    # Serializes the refill/consume read-modify-write under threaded workers
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
 
 
 _buckets: Dict[str, Bucket] = {}
 
 
+def client_ip() -> str:
+    """
+    Best-effort client IP, computed once per request. If you are behind a trusted
+    reverse proxy, configure Flask/werkzeug ProxyFix and rely on X-Forwarded-For safely.
+    """
+    ip = g.get("_client_ip")
+    if ip is None:
+        ip = request.headers.get("X-Forwarded-For", request.remote_addr or "0.0.0.0")
+        # Use first IP in XFF if present
+        ip = g._client_ip = ip.split(",")[0].strip()
+    return ip
+
+
+@lru_cache(maxsize=8192)
+def _ua_hash(ua: str) -> str:
+    # Crawlers resend the same UA on every hit, so this is nearly always a cache hit
+    return hashlib.sha256(ua.encode("utf-8", "ignore")).hexdigest()[:12]
+
+
 def client_key() -> str:
     """
-    Best-effort client key. If you are behind a trusted reverse proxy,
-    configure Flask/werkzeug ProxyFix and rely on X-Forwarded-For safely.
+    Best-effort client key, memoized on the request context.
     """
-    ip = request.headers.get("X-Forwarded-For", request.remote_addr or "0.0.0.0")
-    # Use first IP in XFF if present
-    ip = ip.split(",")[0].strip()
-    ua = request.headers.get("User-Agent", "")
-    # Hash UA to avoid logging raw UA in rate limiter key
-    ua_hash = hashlib.sha256(ua.encode("utf-8", "ignore")).hexdigest()[:12]
-    return f"{ip}:{ua_hash}"
+    ck = g.get("_client_key")
+    if ck is None:
+        # Hash UA to avoid logging raw UA in rate limiter key
+        ua = request.headers.get("User-Agent", "")
+        ck = g._client_key = f"{client_ip()}:{_ua_hash(ua)}"
+    return ck
 
 
-def allow_request(key: str) -> bool:
-    now = time.time()
+def allow_request(key: str, now: float) -> bool:
     b = _buckets.get(key)
     if b is None:
-        _buckets[key] = Bucket(tokens=float(RATE_LIMIT_BURST - 1), last=now)
-        return True
+        if _pruner is None:
+            _start_pruner()
+        # setdefault is atomic: concurrent first hits all land on the same bucket
+        b = _buckets.setdefault(key, Bucket(tokens=float(RATE_LIMIT_BURST), last=now))
 
-    # Refill
-    elapsed = now - b.last
-    b.last = now
-    b.tokens = min(float(RATE_LIMIT_BURST), b.tokens + elapsed * RATE_LIMIT_RPS)
+    with b.lock:
+        # Refill
+        elapsed = max(0.0, now - b.last)
+        b.last = max(b.last, now)
+        b.tokens = min(float(RATE_LIMIT_BURST), b.tokens + elapsed * RATE_LIMIT_RPS)
 
-    if b.tokens >= 1.0:
-        b.tokens -= 1.0
-        return True
-    return False
+        if b.tokens >= 1.0:
+            b.tokens -= 1.0
+            return True
+        return False
 
 
 # ----------------------------
@@ -119,206 +159,463 @@ CREATE TABLE IF NOT EXISTS hits (
     user_agent TEXT,
     accept TEXT,
     accept_lang TEXT,
-    accept_enc TEXT,
-    connection TEXT,
-    sec_ch_ua TEXT,
-    sec_ch_platform TEXT,
-    sec_fetch_site TEXT,
-    sec_fetch_mode TEXT,
-    sec_fetch_dest TEXT,
     cookies_present INTEGER,
     depth INTEGER,
     score INTEGER,
     chain TEXT,
-    latency_ms INTEGER
+    latency_ms INTEGER,
+    headers_json TEXT
 );
 
-CREATE INDEX IF NOT EXISTS idx_hits_ts ON hits(ts);
-CREATE INDEX IF NOT EXISTS idx_hits_client_key ON hits(client_key);
-CREATE INDEX IF NOT EXISTS idx_hits_path ON hits(path);
+-- Index maintenance is paid on every insert, so only suspicious hits
+-- (score >= 4, i.e. a scanner UA or worse) are indexed; path is not.
+DROP INDEX IF EXISTS idx_hits_ts;
+DROP INDEX IF EXISTS idx_hits_client_key;
+DROP INDEX IF EXISTS idx_hits_path;
+CREATE INDEX IF NOT EXISTS idx_hits_ts_suspicious ON hits(ts) WHERE score >= 4;
+CREATE INDEX IF NOT EXISTS idx_hits_client_key_suspicious ON hits(client_key) WHERE score >= 4;
 """
 
-
-def db() -> sqlite3.Connection:
-    if "db" not in g:
-        conn = sqlite3.connect(DB_PATH)
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute("PRAGMA synchronous=NORMAL;")
+# Rarely queried headers, stored together in hits.headers_json. sec_ch_ua and
+# sec_fetch_mode go in the blob too, but honey() has already read them for
+# scoring and adds them from its locals.
+BLOB_HEADERS = (
+    ("accept_enc", "Accept-Encoding"),
+    ("connection", "Connection"),
+    ("sec_ch_platform", "Sec-CH-UA-Platform"),
+    ("sec_fetch_site", "Sec-Fetch-Site"),
+    ("sec_fetch_dest", "Sec-Fetch-Dest"),
+)
+
+
+# Per-connection tuning for the writer; journal_mode=WAL persists in the file
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA mmap_size=268435456;",
+    "PRAGMA cache_size=-65536;",
+    "PRAGMA busy_timeout=5000;",
+)
+
+
+def init_db() -> sqlite3.Connection:
+    """
+    Create the schema and return the tuned connection the writer keeps for the
+    life of the process; nothing else opens the file.
+    auto_vacuum only takes effect on a database that has no tables yet, so it
+    is set before the schema runs.
+    """
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    try:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
         conn.executescript(SCHEMA)
-        g.db = conn
-    return g.db
+        # Databases created before headers_json existed keep their old header
+        # columns (left NULL from now on) and gain the new one
+        cols = {row[1] for row in conn.execute("PRAGMA table_info(hits)")}
+        if "headers_json" not in cols:
+            conn.execute("ALTER TABLE hits ADD COLUMN headers_json TEXT")
+            conn.commit()
+    except sqlite3.Error:
+        conn.close()
+        raise
+    return conn
 
 
-@app.teardown_appcontext
-def close_db(_exc):
-    conn = g.pop("db", None)
-    if conn is not None:
-        conn.close()
+# Column order of the row tuples queued for the writer
+HIT_COLS = (
+    "ts", "client_ip", "client_key", "method", "path", "query", "referer",
+    "user_agent", "accept", "accept_lang", "cookies_present", "depth", "score",
+    "chain", "latency_ms", "headers_json",
+)
+HIT_SQL = f"INSERT INTO hits ({', '.join(HIT_COLS)}) VALUES ({', '.join('?' * len(HIT_COLS))})"
+
+# Queued by _stop_writer at exit: the writer flushes what is left and returns
+_STOP = object()
+
+_write_q: queue.Queue = queue.Queue(maxsize=WRITE_QUEUE_MAX)
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+
+# Hits shed because the queue was full, since the writer last reported them
+_dropped = 0
+_dropped_lock = threading.Lock()
+
+
+def _take_dropped() -> int:
+    global _dropped
+    with _dropped_lock:
+        n, _dropped = _dropped, 0
+    return n
+
+
+def _writer_loop(conn: sqlite3.Connection) -> None:
+    """
+    Single long-lived writer: drains the queue in batches so each commit
+    (and its fsync) covers up to WRITE_BATCH_MAX hits instead of one.
+    """
+    next_optimize = time.monotonic() + OPTIMIZE_INTERVAL
+    next_report = time.monotonic() + DROP_REPORT_INTERVAL
+    stopping = False
+
+    while not stopping:
+        # Wake up at least once per optimize interval, even when idle
+        try:
+            rows = [_write_q.get(timeout=max(0.0, next_optimize - time.monotonic()))]
+        except queue.Empty:
+            rows = []
+
+        deadline = time.monotonic() + WRITE_BATCH_WINDOW
+        while rows and len(rows) < WRITE_BATCH_MAX:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                rows.append(_write_q.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        if any(row is _STOP for row in rows):
+            # Shutting down: take everything still queued in this last batch
+            stopping = True
+            while True:
+                try:
+                    rows.append(_write_q.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [row for row in rows if row is not _STOP]
+
+        if stopping or time.monotonic() >= next_report:
+            dropped = _take_dropped()
+            if dropped:
+                app.logger.warning("Telemetry queue full; dropped %d hits", dropped)
+            next_report = time.monotonic() + DROP_REPORT_INTERVAL
+
+        if rows:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(HIT_SQL, rows)
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                app.logger.exception("Dropped %d telemetry rows", len(rows))
+
+        if time.monotonic() >= next_optimize:
+            # Rescheduled up front, so a failing pragma is retried next
+            # interval rather than on every pass
+            next_optimize = time.monotonic() + OPTIMIZE_INTERVAL
+            try:
+                conn.execute("PRAGMA optimize;")
+                # execute() steps a statement once, which frees a single page;
+                # executescript() runs incremental_vacuum to completion
+                conn.executescript("PRAGMA incremental_vacuum;")
+            except sqlite3.Error:
+                app.logger.exception("Telemetry database maintenance failed")
+
+    conn.close()
+
+
+def _start_writer() -> None:
+    """
+    Open the database and start the writer on the first hit. Nothing is done
+    at import: under gunicorn --preload the module loads in the master, and a
+    thread or connection made there would not carry over to the workers.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(
+                target=_writer_loop, args=(init_db(),), name="telemetry-writer", daemon=True
+            )
+            _writer.start()
+
+
+def _stop_writer() -> None:
+    """Flush queued hits at interpreter exit (e.g. a worker handling SIGTERM)."""
+    writer = _writer
+    if writer is None or not writer.is_alive():
+        return
+    try:
+        _write_q.put(_STOP, timeout=5)
+    except queue.Full:
+        return
+    writer.join(timeout=10)
+
 
+def _reset_writer_after_fork() -> None:
+    # The parent's writer thread does not exist in a forked child; the child
+    # starts its own, with an empty queue, on its first hit
+    global _write_q, _writer, _writer_lock, _dropped, _dropped_lock
+    _write_q = queue.Queue(maxsize=WRITE_QUEUE_MAX)
+    _writer = None
+    _writer_lock = threading.Lock()
+    _dropped = 0
+    _dropped_lock = threading.Lock()
 
-def insert_hit(row: dict) -> None:
-    conn = db()
-    cols = ", ".join(row.keys())
-    qs = ", ".join(["?"] * len(row))
-    conn.execute(f"INSERT INTO hits ({cols}) VALUES ({qs})", list(row.values()))
-    conn.commit()
+
+atexit.register(_stop_writer)
+os.register_at_fork(after_in_child=_reset_writer_after_fork)
+
+
+def insert_hit(row: tuple) -> None:
+    """Queue one hit for the writer; `row` holds values in HIT_COLS order."""
+    global _dropped
+    if _writer is None:
+        _start_writer()
+    try:
+        _write_q.put_nowait(row)
+    except queue.Full:
+        # Writer is falling behind; shed telemetry rather than stall the request
+        with _dropped_lock:
+            _dropped += 1
 
 
 # ----------------------------
-# Tokenized link generation (HMAC)
+# Tokenized link generation (keyed BLAKE2b MAC)
 # ----------------------------
 
-def sign(payload: str) -> str:
-    mac = hmac.new(SECRET_BYTES, payload.encode("utf-8"), hashlib.sha256).digest()
-    return base64.urlsafe_b64encode(mac).decode("ascii").rstrip("=")
+# Binary token layout:
+#   header (version, depth, link index, seed length) | seed | chain | MAC
+# Seeds are hex strings and travel as raw bytes; the chain travels as-is.
+TOKEN_VERSION = 1
+TOKEN_HDR = struct.Struct("!BHHB")
+TOKEN_MAC_SIZE = 16
+
+# Depth and link index are 16-bit header fields; tokens go up to depth
+# MAX_DEPTH and index LINKS_PER_PAGE - 1
+if not 0 <= MAX_DEPTH <= 0xFFFF:
+    raise ValueError("TSUKUYOMI_MAX_DEPTH must be between 0 and 65535 to fit in a token")
+if not 0 <= LINKS_PER_PAGE <= 0x10000:
+    raise ValueError("TSUKUYOMI_LINKS_PER_PAGE must be between 0 and 65536 to fit in a token")
+
+
+def sign(payload: bytes) -> bytes:
+    # Keyed BLAKE2b is a MAC on its own; no HMAC double-hash construction needed
+    return hashlib.blake2b(payload, key=MAC_KEY, digest_size=TOKEN_MAC_SIZE).digest()
 
 
 def make_token(seed: str, depth: int, idx: int, chain: str) -> str:
     """
     Token encodes minimal state to support bounded traversal without server-side sessions.
     """
-    payload = json.dumps(
-        {"s": seed, "d": depth, "i": idx, "c": chain},
-        separators=(",", ":"),
-        ensure_ascii=False,
-    )
-    sig = sign(payload)
-    blob = base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
-    return f"{blob}.{sig}"
+    seed_raw = bytes.fromhex(seed)
+    payload = TOKEN_HDR.pack(TOKEN_VERSION, depth, idx, len(seed_raw)) + seed_raw + chain.encode("utf-8")
+    return base64.urlsafe_b64encode(payload + sign(payload)).decode("ascii").rstrip("=")
 
 
 def parse_token(token: str) -> Optional[dict]:
     try:
-        blob, sig = token.split(".", 1)
-        padded = blob + "=" * (-len(blob) % 4)
-        payload = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
-        if not hmac.compare_digest(sign(payload), sig):
-            return None
-        obj = json.loads(payload)
-        # Minimal validation
-        if not isinstance(obj, dict):
-            return None
-        if not isinstance(obj.get("s"), str):
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        if len(raw) < TOKEN_HDR.size + TOKEN_MAC_SIZE:
             return None
-        if not isinstance(obj.get("d"), int):
+        payload, mac = raw[:-TOKEN_MAC_SIZE], raw[-TOKEN_MAC_SIZE:]
+        if not hmac.compare_digest(sign(payload), mac):
             return None
-        if not isinstance(obj.get("i"), int):
+        version, depth, idx, seed_len = TOKEN_HDR.unpack_from(payload)
+        # Minimal validation
+        if version != TOKEN_VERSION:
             return None
-        if not isinstance(obj.get("c"), str):
+        seed_end = TOKEN_HDR.size + seed_len
+        if len(payload) < seed_end:
             return None
-        return obj
+        return {
+            "s": payload[TOKEN_HDR.size:seed_end].hex(),
+            "d": depth,
+            "i": idx,
+            "c": payload[seed_end:].decode("utf-8"),
+        }
     except Exception:
         return None
 
 
 # ----------------------------
-# Bot scoring (simple + explainable)
+# Per-client hourly budget
 # ----------------------------
 
-def bot_score() -> int:
-    score = 0
-
-    ua = request.headers.get("User-Agent", "")
-    accept = request.headers.get("Accept", "")
-    al = request.headers.get("Accept-Language", "")
-
-    # Very common in scanners / scripts
-    scanner_markers = [
-        "nikto", "sqlmap", "acunetix", "nessus", "qualys", "openvas", "wpscan",
-        "masscan", "nmap", "zaproxy", "burp", "curl", "python-requests", "go-http-client",
-        "scrapy", "java/", "apache-httpclient", "libwww", "wget"
-    ]
-    ua_l = ua.lower()
-    if any(m in ua_l for m in scanner_markers):
-        score += 4
-
-    # Odd header patterns
-    if not ua:
-        score += 3
-    if not accept:
-        score += 2
-    if not al:
-        score += 1
-
-    # Presence of modern browser client hints may reduce score slightly
-    if request.headers.get("Sec-CH-UA"):
-        score -= 1
-    if request.headers.get("Sec-Fetch-Mode"):
-        score -= 1
-
-    # If they send no cookies repeatedly, typical for scanners
-    if not request.cookies:
-        score += 1
-
-    # Clamp to [0, 10]
-    return max(0, min(10, score))
+# client key -> [hour, count in that hour, count in the hour before]
+_budget: Dict[str, List[int]] = {}
 
 
-# ----------------------------
-# Per-client hourly budget
-# ----------------------------
+def within_hourly_budget(ck: str, now: float) -> bool:
+    """
+    Sliding-window counter: one entry per client, no matter how long it stays.
+    The previous hour's count is weighted by how much of it the last 60 minutes
+    still overlap.
+    """
+    hour = int(now // 3600)
+    b = _budget.get(ck)
+    if b is None:
+        if _pruner is None:
+            _start_pruner()
+        b = _budget[ck] = [hour, 0, 0]
+    elif b[0] != hour:
+        b[2] = b[1] if b[0] == hour - 1 else 0
+        b[1] = 0
+        b[0] = hour
+    b[1] += 1
+
+    overlap = 1.0 - (now / 3600 - hour)
+    return b[1] + b[2] * overlap <= MAX_PAGES_PER_CLIENT_PER_HOUR
+
+
+def _prune_limiters() -> None:
+    """Periodically drop limiter state for clients that have gone quiet."""
+    # A bucket idle this long has refilled completely, same as a fresh one
+    bucket_idle = RATE_LIMIT_BURST / RATE_LIMIT_RPS
+    while True:
+        time.sleep(LIMITER_PRUNE_INTERVAL)
+        now = time.time()
+        hour = int(now // 3600)
+        for k, b in list(_budget.items()):
+            if b[0] < hour - 1:
+                _budget.pop(k, None)
+        for k, bucket in list(_buckets.items()):
+            if now - bucket.last > bucket_idle:
+                _buckets.pop(k, None)
+
+
+_pruner: Optional[threading.Thread] = None
+_pruner_lock = threading.Lock()
+
+
+def _start_pruner() -> None:
+    """
+    Start pruning when the first client is added, in the process that holds
+    the limiter state; like the writer, not at import (see _start_writer).
+    """
+    global _pruner
+    with _pruner_lock:
+        if _pruner is None:
+            _pruner = threading.Thread(target=_prune_limiters, name="limiter-prune", daemon=True)
+            _pruner.start()
 
-_budget: Dict[Tuple[str, int], int] = {}
 
+def _reset_pruner_after_fork() -> None:
+    # The child inherits the limiter dicts but not the thread pruning them
+    global _pruner, _pruner_lock
+    _pruner = None
+    _pruner_lock = threading.Lock()
 
-def within_hourly_budget(ck: str) -> bool:
-    hour = int(time.time() // 3600)
-    k = (ck, hour)
-    _budget[k] = _budget.get(k, 0) + 1
-    return _budget[k] <= MAX_PAGES_PER_CLIENT_PER_HOUR
+
+os.register_at_fork(after_in_child=_reset_pruner_after_fork)
 
 
 # ----------------------------
 # Responses
 # ----------------------------
 
-def common_headers(resp):
-    resp.headers["Server"] = APP_NAME
-    resp.headers["X-Robots-Tag"] = "noindex, nofollow, noarchive"
-    resp.headers["Cache-Control"] = "no-store"
-    resp.headers["Content-Type"] = "text/html; charset=utf-8"
-    return resp
+# Headers for every HTML page. Kept as pairs: Response() adopts a Headers
+# instance as-is and then sets Content-Length on it, so sharing one would leak
+# lengths between responses.
+_COMMON_HEADERS = (
+    ("Server", APP_NAME),
+    ("X-Robots-Tag", "noindex, nofollow, noarchive"),
+    ("Cache-Control", "no-store"),
+    ("Content-Type", "text/html; charset=utf-8"),
+)
 
 
-def render_page(title: str, body_html: str, status: int = 200):
-    html = f"""<!doctype html>
+# Page skeleton, pre-encoded; render_page splices title, body and ts in between
+_PAGE_PRE = b"""<!doctype html>
 <html>
   <head>
     <meta charset="utf-8">
     <meta name="robots" content="noindex,nofollow,noarchive">
-    <title>{title}</title>
+    <title>"""
+_PAGE_MID = b"""</title>
   </head>
   <body style="font-family: ui-monospace, SFMono-Regular, Menlo, Consolas, monospace; padding: 1rem;">
-    <h1>{title}</h1>
-    {body_html}
+    <h1>"""
+_PAGE_POST = b"""</h1>
+    """
+_PAGE_TAIL = b"""
     <hr>
-    <small>ts={time.time():.3f}</small>
+    <small>ts="""
+_PAGE_END = b"""</small>
   </body>
 </html>"""
-    resp = make_response(html, status)
-    return common_headers(resp)
 
 
-def render_terminal(depth: int):
+def delay_response(resp, delay: float):
+    """
+    Drip the body out over `delay` seconds: headers and the first piece go out
+    at once, so the client is committed to the response, then the remaining
+    pieces follow with pauses in between. The waiting still occupies the
+    worker thread; only gevent workers (see README) turn it into a
+    cooperative sleep.
+    """
+    body = resp.get_data()
+    step = -(-len(body) // DELAY_DRIP_CHUNKS)
+    pause = delay / max(1, DELAY_DRIP_CHUNKS - 1)
+
+    def drip():
+        yield body[:step]
+        for start in range(step, len(body), step):
+            time.sleep(pause)
+            yield body[start:start + step]
+
+    resp.response = drip()
+    return resp
+
+
+def page_bytes(title: str, body_html: Union[str, bytes], ts: float) -> bytes:
+    if isinstance(body_html, str):
+        body_html = body_html.encode("utf-8")
+    title_b = title.encode("utf-8")
+
+    html = bytearray(_PAGE_PRE)
+    html += title_b
+    html += _PAGE_MID
+    html += title_b
+    html += _PAGE_POST
+    html += body_html
+    html += _PAGE_TAIL
+    html += b"%.3f" % ts
+    html += _PAGE_END
+    return bytes(html)
+
+
+def render_page(title: str, body_html: Union[str, bytes], status: int = 200):
+    return Response(page_bytes(title, body_html, time.time()), status=status, headers=_COMMON_HEADERS)
+
+
+def _terminal_page(depth: int) -> bytes:
     body = f"""
     <p>Traversal ended (depth={depth}).</p>
     <p>If you are a human, there is nothing to do here.</p>
     """
-    return render_page("Nothing here", body, 200)
+    return page_bytes("Nothing here", body, _STARTED)
 
 
-def render_throttled():
-    body = """
+# Pages with no per-request content are rendered once; their ts footer is the
+# process start time rather than the request time.
+_STARTED = time.time()
+_TERMINAL_PAGE = _terminal_page(MAX_DEPTH)
+_THROTTLED_PAGE = page_bytes("Slow down", """
     <p>Request rate limited.</p>
-    """
-    return render_page("Slow down", body, 429)
+    """, _STARTED)
+_BUDGET_PAGE = page_bytes("Budget exhausted", """
+    <p>Client hourly budget exhausted.</p>
+    """, _STARTED)
+_DOCS_PAGE = page_bytes("Docs", """
+    <p>Documentation placeholder.</p>
+    <p>If you are seeing this, you are likely not looking for real docs.</p>
+    """, _STARTED)
+
+
+def render_terminal(depth: int):
+    body = _TERMINAL_PAGE if depth == MAX_DEPTH else _terminal_page(depth)
+    return Response(body, status=200, headers=_COMMON_HEADERS)
+
+
+def render_throttled():
+    return Response(_THROTTLED_PAGE, status=429, headers=_COMMON_HEADERS)
 
 
 def render_budget_exhausted():
-    body = """
-    <p>Client hourly budget exhausted.</p>
-    """
-    return render_page("Budget exhausted", body, 429)
+    return Response(_BUDGET_PAGE, status=429, headers=_COMMON_HEADERS)
 
 
 def render_root(seed: str):
@@ -339,30 +636,53 @@ def render_root(seed: str):
     return render_page("Index", body, 200)
 
 
-def render_honey(seed: str, depth: int, chain: str):
-    # Bounded traversal: stop at MAX_DEPTH
-    if depth >= MAX_DEPTH:
-        return render_terminal(depth)
+@lru_cache(maxsize=16384)
+def _branch_seeds(seed: str, depth: int) -> Tuple[str, ...]:
+    # Deterministically derive next “branch seeds”; crawlers revisit nodes a lot
+    return tuple(
+        hashlib.blake2s(f"{seed}:{depth}:{i}".encode("utf-8"), digest_size=6).hexdigest()
+        for i in range(LINKS_PER_PAGE)
+    )
+
+
+def _iter_branches(seed: str, depth: int, chain: str) -> Iterator[Tuple[str, str]]:
+    """Yield (child seed, child token) for each link on a node page."""
+    for i, nxt_seed in enumerate(_branch_seeds(seed, depth)):
+        tok = make_token(seed=nxt_seed, depth=depth + 1, idx=i, chain=f"{chain}/{nxt_seed}")
+        yield nxt_seed, tok
+
 
-    # Deterministically derive next “branch seeds”
-    links = []
-    for i in range(LINKS_PER_PAGE):
-        nxt_seed = hashlib.sha256(f"{seed}:{depth}:{i}".encode("utf-8")).hexdigest()[:12]
-        nxt_chain = f"{chain}/{nxt_seed}"
-        tok = make_token(seed=nxt_seed, depth=depth + 1, idx=i, chain=nxt_chain)
-        links.append(f'<li><a href="/_honey/{tok}">node:{nxt_seed}</a></li>')
+_LI = '<li><a href="/_honey/{tok}">node:{seed}</a></li>'
+
+
+@lru_cache(maxsize=16384)
+def _honey_body(seed: str, depth: int, chain: str) -> bytes:
+    """
+    Page body for one node. The chain is part of the key because it is baked
+    into the child tokens; the ts footer is added fresh by render_page.
+    """
+    links_html = "".join(
+        _LI.format(tok=tok, seed=nxt_seed) for nxt_seed, tok in _iter_branches(seed, depth, chain)
+    )
 
     # Mildly realistic-looking content (harmless)
-    body = f"""
+    return f"""
     <p><b>Depth:</b> {depth} / {MAX_DEPTH}</p>
     <p><b>Node:</b> {seed}</p>
     <p><b>Hint:</b> If you are an automated client, this path is intentionally non-actionable.</p>
     <h3>Related</h3>
     <ul>
-      {''.join(links)}
+      {links_html}
     </ul>
-    """
-    return render_page("Internal metadata", body, 200)
+    """.encode("utf-8")
+
+
+def render_honey(seed: str, depth: int, chain: str):
+    # Bounded traversal: stop at MAX_DEPTH
+    if depth >= MAX_DEPTH:
+        return render_terminal(depth)
+
+    return render_page("Internal metadata", _honey_body(seed, depth, chain), 200)
 
 
 # ----------------------------
@@ -371,25 +691,29 @@ def render_honey(seed: str, depth: int, chain: str):
 
 @app.route("/")
 def index():
+    now = time.time()
     ck = client_key()
-    if not allow_request(ck):
+    if not allow_request(ck, now):
         return render_throttled()
-    if not within_hourly_budget(ck):
+    if not within_hourly_budget(ck, now):
         return render_budget_exhausted()
 
-    seed = hashlib.sha256(str(time.time()).encode("utf-8")).hexdigest()[:10]
+    # Unauthenticated by itself; the token MAC is what protects it
+    seed = secrets.token_hex(5)
     return render_root(seed)
 
 
 @app.route("/_honey/<token>")
 def honey(token: str):
-    t0 = time.time()
+    # Monotonic for latency (immune to clock steps); wall clock only for the row
+    t0 = time.monotonic_ns()
+    now = time.time()
     ck = client_key()
 
     # Rate limit first
-    if not allow_request(ck):
+    if not allow_request(ck, now):
         return render_throttled()
-    if not within_hourly_budget(ck):
+    if not within_hourly_budget(ck, now):
         return render_budget_exhausted()
 
     # Parse token
@@ -404,56 +728,71 @@ def honey(token: str):
         depth = obj["d"]
         chain = obj["c"]
 
-    score = bot_score()
+    # Read every header once; scoring and telemetry share the locals
+    h = request.headers
+    ua = h.get("User-Agent", "")
+    accept = h.get("Accept", "")
+    accept_lang = h.get("Accept-Language", "")
+    sec_ch_ua = h.get("Sec-CH-UA", "")
+    sec_fetch_mode = h.get("Sec-Fetch-Mode", "")
+    cookies_present = bool(request.cookies)
+
+    score = bot_score(ua, accept, accept_lang, sec_ch_ua, sec_fetch_mode, cookies_present)
 
-    # Optional: small delay for high score (do NOT overdo it; keep it bounded)
+    # Optional: small delay for high score (do NOT overdo it; keep it bounded).
+    # Applied to the response body below rather than slept here.
+    delay = 0.0
     if ADD_ARTIFICIAL_DELAY_FOR_HIGH_SCORE and score >= 6:
         delay = min(MAX_DELAY_SECONDS, 0.15 * score)
-        time.sleep(delay)
 
-    latency_ms = int((time.time() - t0) * 1000)
+    latency_ms = (time.monotonic_ns() - t0) // 1_000_000
 
     # Log telemetry (minimize what you store if necessary)
-    ip = request.headers.get("X-Forwarded-For", request.remote_addr or "")
-    ip = ip.split(",")[0].strip()
-
-    row = dict(
-        ts=time.time(),
-        client_ip=ip,
-        client_key=ck,
-        method=request.method,
-        path=request.path,
-        query=request.query_string.decode("utf-8", "ignore"),
-        referer=request.headers.get("Referer", ""),
-        user_agent=request.headers.get("User-Agent", ""),
-        accept=request.headers.get("Accept", ""),
-        accept_lang=request.headers.get("Accept-Language", ""),
-        accept_enc=request.headers.get("Accept-Encoding", ""),
-        connection=request.headers.get("Connection", ""),
-        sec_ch_ua=request.headers.get("Sec-CH-UA", ""),
-        sec_ch_platform=request.headers.get("Sec-CH-UA-Platform", ""),
-        sec_fetch_site=request.headers.get("Sec-Fetch-Site", ""),
-        sec_fetch_mode=request.headers.get("Sec-Fetch-Mode", ""),
-        sec_fetch_dest=request.headers.get("Sec-Fetch-Dest", ""),
-        cookies_present=1 if bool(request.cookies) else 0,
-        depth=depth if isinstance(depth, int) else -1,
-        score=score,
-        chain=chain,
-        latency_ms=latency_ms,
+    ip = client_ip()
+    blob = {col: h.get(name, "") for col, name in BLOB_HEADERS}
+    blob["sec_ch_ua"] = sec_ch_ua
+    blob["sec_fetch_mode"] = sec_fetch_mode
+
+    # Positional, in HIT_COLS order
+    row = (
+        now,                                                  # ts
+        ip,                                                   # client_ip
+        ck,                                                   # client_key
+        request.method,                                       # method
+        request.path,                                         # path
+        request.query_string.decode("utf-8", "ignore"),       # query
+        h.get("Referer", ""),                                 # referer
+        ua,                                                   # user_agent
+        accept,                                               # accept
+        accept_lang,                                          # accept_lang
+        1 if cookies_present else 0,                          # cookies_present
+        depth if isinstance(depth, int) else -1,              # depth
+        score,                                                # score
+        chain,                                                # chain
+        latency_ms,                                           # latency_ms
+        json.dumps(blob, separators=(",", ":")),              # headers_json
     )
     insert_hit(row)
 
     # Render response
     if obj is None:
-        return render_page("Invalid", "<p>Invalid token.</p>", 400)
+        resp = render_page("Invalid", "<p>Invalid token.</p>", 400)
+    else:
+        resp = render_honey(seed=seed, depth=depth, chain=chain)
 
-    return render_honey(seed=seed, depth=depth, chain=chain)
+    return delay_response(resp, delay) if delay else resp
 
 
 # Simple “normal” decoy endpoints (optional)
+_STATUS_PREFIX = b'{"ok":true,"ts":'
+_STATUS_SUFFIX = b"}\n"
+
+
 @app.route("/status")
 def status():
-    resp = make_response({"ok": True, "ts": time.time()})
+    # Fixed shape, so skip the JSON provider and splice the timestamp in
+    resp = make_response(b"%s%.3f%s" % (_STATUS_PREFIX, time.time(), _STATUS_SUFFIX))
+    resp.mimetype = "application/json"
     resp.headers["Cache-Control"] = "no-store"
     resp.headers["X-Robots-Tag"] = "noindex, nofollow, noarchive"
     return resp
@@ -461,11 +800,7 @@ def status():
 
 @app.route("/docs")
 def docs():
-    body = """
-    <p>Documentation placeholder.</p>
-    <p>If you are seeing this, you are likely not looking for real docs.</p>
-    """
-    return render_page("Docs", body, 200)
+    return Response(_DOCS_PAGE, status=200, headers=_COMMON_HEADERS)
 
 
 if __name__ == "__main__":